@@ -0,0 +1,108 @@
+' Compare the ffmpeg filter graph compositor against the numpy compositor '
+
+import argparse
+import asyncio
+import logging
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+# Use the local teslacam code rather than any installed copy
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+#pylint: disable=wrong-import-position
+from teslacam import (
+    constants,
+    custom_types,
+    extract,
+    layout
+)
+
+async def _benchmark(args, output_folder_path):
+    ' Encode the same segments with every compositor and return their timings '
+    layout_offsets = constants.LAYOUT_OFFSETS[args.layout]
+    video_file_map = await extract.create_video_file_map(
+        args.ffprobe_file_path,
+        asyncio.Semaphore(os.cpu_count()),
+        args.input_folder_path,
+        set(layout.get_layout_cameras(layout_offsets))
+    )
+    video_layout = extract.create_video_layout(video_file_map, layout_offsets)
+    video_file_infos = sorted(video_file_map.items())[:args.segments]
+    footage_seconds = sum(float(info['duration']) for _, info in video_file_infos)
+
+    # Read every camera file once so neither compositor benefits from the other warming the
+    # page cache, then alternate which compositor goes first on each repeat
+    for _, video_file_stream_info in video_file_infos:
+        for video_camera_file_path in video_file_stream_info['cameras'].values():
+            video_camera_file_path.read_bytes()
+
+    timings = {compositor_name: [] for compositor_name in constants.COMPOSITORS}
+    for repeat in range(args.repeats):
+        compositor_names = constants.COMPOSITORS[::-1 if repeat % 2 else 1]
+        for compositor_name in compositor_names:
+            layout_options = custom_types.LayoutOptions(
+                args.codec,
+                args.preset,
+                args.layout,
+                args.reduce,
+                compositor_name,
+            )
+            working_layout_folder_path = output_folder_path / f'{compositor_name}_{repeat}'
+            working_layout_folder_path.mkdir()
+            start_time = time.perf_counter()
+            for video_file_info in video_file_infos:
+                await extract.create_layout_video_process(
+                    video_file_info,
+                    args.ffmpeg_file_path,
+                    layout_options,
+                    video_layout,
+                    working_layout_folder_path
+                )
+            timings[compositor_name].append(time.perf_counter() - start_time)
+    return footage_seconds, timings
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('ffprobe_file_path', type=pathlib.Path, help='Path to the ffprobe binary')
+    parser.add_argument('ffmpeg_file_path', type=pathlib.Path, help='Path to the ffmpeg binary')
+    parser.add_argument(
+        'input_folder_path',
+        type=pathlib.Path,
+        help='Path to a single timestamped folder of camera videos',
+    )
+    parser.add_argument('--segments', type=int, default=3, help='Number of segments to encode')
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=3,
+        help='Times to run each compositor.  The order alternates between repeats',
+    )
+    parser.add_argument('--codec', default='libx265', choices=constants.CODEC_OPTIONS.keys())
+    parser.add_argument('--preset', default='fast')
+    parser.add_argument('--layout', default='pyramid', choices=constants.LAYOUT_OFFSETS.keys())
+    parser.add_argument('--reduce', type=float, default=constants.DONT_REDUCE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as output_folder:
+        footage_seconds, timings = asyncio.run(_benchmark(args, pathlib.Path(output_folder)))
+
+    print(f'footage: {footage_seconds:.1f}s')
+    for compositor_name, repeat_seconds in timings.items():
+        seconds = statistics.median(repeat_seconds)
+        print(
+            f'{compositor_name}: median {seconds:.2f}s of {len(repeat_seconds)} '
+            f'({footage_seconds / seconds:.2f}x realtime)'
+        )
+
+
+if __name__ == '__main__':
+    _main()
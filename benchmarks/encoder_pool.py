@@ -0,0 +1,146 @@
+' Check that segments encoded by a pool of several codecs join into one clean video '
+
+import argparse
+import asyncio
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+# Use the local teslacam code rather than any installed copy
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+#pylint: disable=wrong-import-position
+from teslacam import (
+    arg_parser,
+    constants,
+    custom_types,
+    encoder_pool,
+    extract
+)
+
+def _decode(ffmpeg_file_path, video_file_path):
+    ' Decode every frame and return the frame count and any errors ffmpeg reported '
+    proc = subprocess.run(
+        [
+            ffmpeg_file_path,
+            '-v', 'error',
+            '-i', video_file_path,
+            '-map', '0:v', '-f', 'framemd5', '-',
+        ],
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    frame_count = sum(
+        1 for line in proc.stdout.splitlines() if line and not line.startswith('#')
+    )
+    errors = proc.stderr.splitlines()
+    if errors:
+        return frame_count, f'{errors[0]} ({len(errors)} errors)'
+    return frame_count, proc.returncode and f'exit status {proc.returncode}'
+
+
+async def _merge(args, working_layout_folder_path, output_file_path):
+    ' Merge one folder with the pool and return the codec that encoded each segment '
+    layout_options = custom_types.LayoutOptions(
+        args.codec,
+        args.preset,
+        'pyramid',
+        args.reduce,
+    )
+    video_file_map = await extract.create_video_file_map(
+        args.ffprobe_file_path,
+        asyncio.Semaphore(os.cpu_count()),
+        args.input_folder_path,
+        extract.get_selected_cameras(layout_options)
+    )
+    acquire_encoder = encoder_pool.EncoderPool(encoder_pool.get_codec_capacities(args.codec))
+
+    # Record which codec each segment got before any transcoding
+    codecs = {}
+    original_create_layout_video = extract.create_layout_video
+    async def _create_layout_video(video_file_info, *create_args):
+        codecs[video_file_info[0]] = await original_create_layout_video(
+            video_file_info,
+            *create_args
+        )
+        return codecs[video_file_info[0]]
+
+    extract.create_layout_video = _create_layout_video
+    try:
+        await extract.merge_video_file_map(
+            args.ffmpeg_file_path,
+            acquire_encoder,
+            layout_options,
+            video_file_map,
+            working_layout_folder_path,
+            output_file_path
+        )
+    finally:
+        extract.create_layout_video = original_create_layout_video
+    return codecs
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('ffprobe_file_path', type=pathlib.Path, help='Path to the ffprobe binary')
+    parser.add_argument('ffmpeg_file_path', type=pathlib.Path, help='Path to the ffmpeg binary')
+    parser.add_argument(
+        'input_folder_path',
+        type=pathlib.Path,
+        help='Path to a single timestamped folder with at least two segments',
+    )
+    parser.add_argument(
+        '--codec',
+        action='append',
+        type=arg_parser.codec_capacity,
+        help='Codec to pool, optionally with a capacity.  Defaults to libx264:1 and libx265:1',
+    )
+    parser.add_argument('--preset', default='ultrafast')
+    parser.add_argument('--reduce', type=float, default=constants.DONT_REDUCE)
+    args = parser.parse_args()
+
+    args.codec = dict(
+        (codec_name, capacity or constants.CODEC_OPTIONS[codec_name][1])
+        for codec_name, capacity in args.codec or [('libx264', 1), ('libx265', 1)]
+    )
+    logging.basicConfig(level=logging.WARNING)
+    problems = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        output_folder_path = pathlib.Path(output_folder)
+        working_layout_folder_path = output_folder_path / 'segments'
+        output_file_path = output_folder_path / 'joined.mp4'
+        codecs = asyncio.run(_merge(args, working_layout_folder_path, output_file_path))
+
+        segment_frame_count = 0
+        for file_basename, codec in sorted(codecs.items()):
+            frame_count, error = _decode(
+                args.ffmpeg_file_path,
+                extract.create_layout_video_file_path(working_layout_folder_path, file_basename)
+            )
+            print(f'{file_basename}: {codec}, {frame_count} frames')
+            segment_frame_count += frame_count
+            if error:
+                problems.append(f'segment {file_basename} failed to decode cleanly: {error}')
+        frame_count, error = _decode(args.ffmpeg_file_path, output_file_path)
+        print(f'joined: {frame_count} frames')
+
+    if len(set(codecs.values())) < min(len(args.codec), len(codecs)):
+        problems.append('not every pooled codec encoded a segment')
+    if error:
+        problems.append(f'the joined video failed to decode cleanly: {error}')
+    if frame_count != segment_frame_count:
+        problems.append(f'the joined video has {frame_count} of {segment_frame_count} frames')
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    _main()
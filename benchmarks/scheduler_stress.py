@@ -0,0 +1,434 @@
+' Stress the extraction scheduler using stand-in ffmpeg and ffprobe executables '
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import contextvars
+import logging
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Use the local teslacam code rather than any installed copy
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+#pylint: disable=wrong-import-position
+from teslacam import (
+    constants,
+    custom_types,
+    encoder_pool,
+    extract
+)
+
+CAMERAS = ('front', 'back', 'left_repeater', 'right_repeater')
+# Serial stand-in runs used to measure the cost of starting one process
+SPAWN_SAMPLES = 20
+
+# Both stand-ins share one script.  ffprobe is recognized by its -show_entries argument
+# and every other invocation is treated as an ffmpeg run whose last argument is the output
+STAND_IN_SOURCE = '''\
+import json
+import os
+import random
+import sys
+import time
+
+def _main():
+    is_probe = '-show_entries' in sys.argv
+    prefix = 'FAKE_FFPROBE_' if is_probe else 'FAKE_FFMPEG_'
+    time.sleep(float(os.environ.get(prefix + 'LATENCY', '0')))
+    if random.random() < float(os.environ.get(prefix + 'FAILURE_RATE', '0')):
+        print('stand-in failure', file=sys.stderr)
+        sys.exit(1)
+
+    if is_probe:
+        duration = os.environ.get('FAKE_FFPROBE_DURATION', '60.0')
+        print(json.dumps({'streams': [{'duration': duration, 'width': 1280, 'height': 960}]}))
+        return
+
+    with open(sys.argv[-1], 'wb') as output_file:
+        output_file.write(b'\\0' * int(os.environ.get('FAKE_FFMPEG_OUTPUT_SIZE', '16')))
+
+_main()
+'''
+
+def _create_stand_ins(folder_path):
+    ' Write executable ffprobe and ffmpeg stand-ins and return their paths '
+    # -S skips site initialization to keep the per-process spawn cost close to a real binary
+    if os.name == 'nt':
+        # Windows can't run a script directly, so both stand-ins launch one shared script
+        # through batch wrappers
+        script_path = folder_path / 'stand_in.py'
+        script_path.write_text(STAND_IN_SOURCE)
+    stand_in_paths = []
+    for name in ('ffprobe', 'ffmpeg'):
+        if os.name == 'nt':
+            stand_in_path = folder_path / f'{name}.cmd'
+            stand_in_path.write_text(f'@"{sys.executable}" -S "{script_path}" %*\n')
+        else:
+            stand_in_path = folder_path / name
+            stand_in_path.write_text(f'#!{sys.executable} -S\n{STAND_IN_SOURCE}')
+            stand_in_path.chmod(0o755)
+        stand_in_paths.append(stand_in_path)
+    return custom_types.FFMpegPaths(*stand_in_paths)
+
+
+def _measure_spawn_time(ffprobe_file_path, count):
+    ' Time serial stand-in runs with no latency to find the cost of starting one process '
+    environment = {**os.environ, 'FAKE_FFPROBE_LATENCY': '0', 'FAKE_FFPROBE_FAILURE_RATE': '0'}
+    start_time = time.perf_counter()
+    for _ in range(count):
+        subprocess.run(
+            [ffprobe_file_path, '-show_entries'],
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            check=True
+        )
+    return (time.perf_counter() - start_time) / count
+
+
+def _create_synthetic_clips(input_folder_path, folder_count, segment_count):
+    ' Create empty camera clips named the way the car names them '
+    for folder_index in range(folder_count):
+        folder_path = input_folder_path / f'2021-01-01_{folder_index:08d}'
+        folder_path.mkdir()
+        for segment_index in range(segment_count):
+            minutes, seconds = divmod(segment_index, 60)
+            hours, minutes = divmod(minutes, 60)
+            prefix = f'2021-01-01_{hours % 24:02d}-{minutes:02d}-{seconds:02d}'
+            for camera in CAMERAS:
+                (folder_path / f'{prefix}-{camera}.mp4').touch()
+
+
+def _set_stand_in_environment(args):
+    ' Configure stand-in behaviour through inherited environment variables '
+    os.environ.update({
+        'FAKE_FFPROBE_DURATION': str(args.duration),
+        'FAKE_FFPROBE_LATENCY': str(args.probe_latency),
+        'FAKE_FFPROBE_FAILURE_RATE': str(args.probe_failure_rate),
+        'FAKE_FFMPEG_LATENCY': str(args.encode_latency),
+        'FAKE_FFMPEG_FAILURE_RATE': str(args.encode_failure_rate),
+    })
+
+
+_ENCODER_WAIT = contextvars.ContextVar('encoder_wait')
+
+@contextlib.contextmanager
+def _record_encoder_waits(waits):
+    ' Record when each segment asks for an encoder and when it actually gets one '
+    original_create_layout_video = extract.create_layout_video
+    original_create_layout_video_process = extract.create_layout_video_process
+
+    # Each segment runs in its own gathered task, so the context variable is per segment
+    async def _create_layout_video(*args, **kwargs):
+        wait = [time.perf_counter(), None]
+        waits.append(wait)
+        _ENCODER_WAIT.set(wait)
+        return await original_create_layout_video(*args, **kwargs)
+
+    async def _create_layout_video_process(*args, **kwargs):
+        _ENCODER_WAIT.get()[1] = time.perf_counter()
+        await original_create_layout_video_process(*args, **kwargs)
+
+    extract.create_layout_video = _create_layout_video
+    extract.create_layout_video_process = _create_layout_video_process
+    try:
+        yield
+    finally:
+        extract.create_layout_video = original_create_layout_video
+        extract.create_layout_video_process = original_create_layout_video_process
+
+
+@contextlib.contextmanager
+def _record_processes(procs):
+    ' Record every process the scheduler starts so leftovers can be found after shutdown '
+    original_create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def _create_subprocess_exec(*args, **kwargs):
+        proc = await original_create_subprocess_exec(*args, **kwargs)
+        procs.append(proc)
+        return proc
+
+    asyncio.create_subprocess_exec = _create_subprocess_exec
+    try:
+        yield
+    finally:
+        asyncio.create_subprocess_exec = original_create_subprocess_exec
+
+
+async def _sample_tasks(samples, interval):
+    ' Periodically sample the number of live asyncio tasks '
+    while True:
+        samples.append(len(asyncio.all_tasks()))
+        await asyncio.sleep(interval)
+
+
+RunResult = collections.namedtuple(
+    'RunResult',
+    [
+        'wall_time', # Seconds until the run completed, failed or was cancelled
+        'task_samples', # Live task counts sampled during the run
+        'error', # Exception that stopped the run or None
+        'orphaned_tasks', # Tasks still running when the run was stopped
+        'shutdown_latency', # Seconds shutdown() took or None when the run completed
+        'remaining_tasks', # Tasks still alive after shutdown() returned
+    ]
+)
+
+async def _run(ffmpeg_paths, layout_options, working_folder_paths, draft_first, cancel_after):
+    ' Run the scheduler and measure how it completes, fails or is cancelled '
+    task_samples = []
+    sampler = asyncio.create_task(_sample_tasks(task_samples, 0.1))
+    start_time = time.perf_counter()
+    run = asyncio.create_task(
+        extract.create_video_files(
+            ffmpeg_paths,
+            layout_options,
+            working_folder_paths,
+            draft_first
+        )
+    )
+    await asyncio.wait([run], timeout=cancel_after)
+    wall_time = time.perf_counter() - start_time
+    if run.done() and not run.exception():
+        sampler.cancel()
+        return RunResult(wall_time, task_samples, None, 0, None, 0)
+
+    # Clean up the way extract_videos does when a run fails.  A failed gather leaves its
+    # siblings running, and shutdown() cancels everything but the current task
+    error = run.exception() if run.done() else None
+    orphaned_tasks = len(asyncio.all_tasks()) - 2 # Skip the current task and the sampler
+    shutdown_start_time = time.perf_counter()
+    await extract.shutdown()
+    shutdown_latency = time.perf_counter() - shutdown_start_time
+    remaining_tasks = len(asyncio.all_tasks()) - 1
+    return RunResult(
+        wall_time,
+        task_samples,
+        error,
+        orphaned_tasks,
+        shutdown_latency,
+        remaining_tasks
+    )
+
+
+def _count_inversions(waits):
+    ' Count segments that got an encoder before a segment that asked earlier '
+    start_times = [start for _, start in sorted(waits) if start is not None]
+    return sum(1 for earlier, later in zip(start_times, start_times[1:]) if later < earlier)
+
+
+Measurement = collections.namedtuple(
+    'Measurement',
+    [
+        'run_result', # How the run completed, failed or was cancelled
+        'waits', # [request time, grant time] for every segment that asked for an encoder
+        'live_processes', # Processes still running once the run and any shutdown() ended
+        'peak_memory', # Peak bytes allocated by python during the run
+        'spawn_time', # Seconds it takes to start and finish a stand-in that does nothing
+    ]
+)
+
+def _measure(args):
+    ' Run the scheduler once against fresh synthetic clips '
+    _set_stand_in_environment(args)
+    with tempfile.TemporaryDirectory() as temp_folder:
+        temp_folder_path = pathlib.Path(temp_folder)
+        folder_paths = custom_types.WorkingFolderPaths(
+            temp_folder_path / 'input',
+            temp_folder_path / 'output',
+            temp_folder_path / 'intermediate',
+        )
+        for folder_path in folder_paths:
+            folder_path.mkdir()
+        ffmpeg_paths = _create_stand_ins(temp_folder_path)
+        _create_synthetic_clips(folder_paths.input, args.folders, args.segments)
+        spawn_time = _measure_spawn_time(ffmpeg_paths.ffprobe, SPAWN_SAMPLES)
+        layout_options = custom_types.LayoutOptions(
+            args.codec,
+            'fast',
+            'pyramid',
+            constants.DONT_REDUCE,
+        )
+
+        waits = []
+        procs = []
+        tracemalloc.start()
+        with _record_encoder_waits(waits), _record_processes(procs):
+            try:
+                run_result = asyncio.run(
+                    _run(
+                        ffmpeg_paths,
+                        layout_options,
+                        folder_paths,
+                        args.draft_first,
+                        args.cancel_after
+                    )
+                )
+            finally:
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+    live_processes = sum(1 for proc in procs if proc.returncode is None)
+    return Measurement(run_result, waits, live_processes, peak_memory, spawn_time)
+
+
+def _report(args, measurement):
+    ' Print measurements '
+    wall_time, task_samples, error, orphaned_tasks, shutdown_latency, remaining_tasks = \
+        measurement.run_result
+    probe_count = args.folders * args.segments * len(CAMERAS)
+    segment_count = args.folders * args.segments
+    encoder_slots = sum(encoder_pool.get_codec_capacities(args.codec).values())
+    # Draft first encodes and joins every folder twice
+    encode_passes = 2 if args.draft_first else 1
+    process_count = probe_count + encode_passes * (segment_count + args.folders)
+    # Every stand-in costs its configured latency plus the time to start python.  The probe
+    # and encode stages overlap across folders so the slower stage bounds the run, and no
+    # run is faster than starting every process on every cpu
+    spawn_time = measurement.spawn_time
+    cpu_count = os.cpu_count()
+    ideal_time = max(
+        probe_count * (args.probe_latency + spawn_time) / cpu_count,
+        encode_passes * segment_count * (args.encode_latency + spawn_time) / encoder_slots,
+        process_count * spawn_time / cpu_count,
+    )
+    overhead = max(wall_time - ideal_time, 0)
+    waits = measurement.waits
+    wait_times = [start - request for request, start in waits if start is not None]
+
+    print(f'folders: {args.folders}  segments: {segment_count}  clips: {probe_count}')
+    print(f'process spawn: {spawn_time * 1000:.3f}ms per process  processes: {process_count}')
+    if error:
+        print(f'failed after {wall_time:.2f}s: {error!r}')
+    elif shutdown_latency is not None:
+        print(f'cancelled after {wall_time:.2f}s')
+    else:
+        print(f'wall time: {wall_time:.2f}s  ideal: {ideal_time:.2f}s')
+        print(
+            f'scheduling overhead: {overhead:.2f}s '
+            f'({overhead / process_count * 1000:.3f}ms per process)'
+        )
+    if task_samples:
+        print(f'tasks: peak {max(task_samples)}  median {statistics.median(task_samples)}')
+    print(f'python memory peak: {measurement.peak_memory / 2**20:.1f}MiB')
+    if wait_times:
+        print(
+            f'encoder wait: min {min(wait_times):.3f}s  '
+            f'median {statistics.median(wait_times):.3f}s  '
+            f'max {max(wait_times):.3f}s  '
+            f'out of order grants {_count_inversions(waits)}'
+        )
+    if shutdown_latency is not None:
+        print(
+            f'shutdown latency: {shutdown_latency:.3f}s  orphaned tasks: {orphaned_tasks}  '
+            f'left after shutdown: {remaining_tasks} tasks, '
+            f'{measurement.live_processes} processes'
+        )
+
+
+def _find_problems(args, measurement):
+    ' Return descriptions of fairness and cleanup regressions '
+    problems = []
+    # Background encodes yield to drafts, so only plain runs must grant encoders in order
+    inversions = _count_inversions(measurement.waits)
+    if inversions and not args.draft_first:
+        problems.append(f'{inversions} encoder grants were out of order')
+    if measurement.run_result.remaining_tasks:
+        problems.append(
+            f'{measurement.run_result.remaining_tasks} tasks were still alive after shutdown()'
+        )
+    if measurement.live_processes:
+        problems.append(f'{measurement.live_processes} processes were left running')
+    return problems
+
+
+# Small runs that exercise completion, failure and cancellation.  --check runs each of them
+# and fails if any shows a fairness or cleanup regression
+CHECK_SCENARIOS = {
+    'complete': {'folders': 4, 'segments': 3, 'encode_latency': 0.05},
+    'failure': {'folders': 4, 'segments': 3, 'encode_latency': 0.2, 'encode_failure_rate': 1.0},
+    'cancel': {'folders': 4, 'segments': 3, 'encode_latency': 0.5, 'cancel_after': 1.0},
+}
+
+def _check(args):
+    ' Run every check scenario and return whether all of them passed '
+    passed = True
+    for scenario_name, overrides in CHECK_SCENARIOS.items():
+        scenario_args = argparse.Namespace(**{**vars(args), **overrides})
+        measurement = _measure(scenario_args)
+        print(f'--- {scenario_name}')
+        _report(scenario_args, measurement)
+        problems = _find_problems(scenario_args, measurement)
+        run_result = measurement.run_result
+        if scenario_name == 'complete' and run_result.shutdown_latency is not None:
+            problems.append('the run did not complete')
+        if scenario_name != 'complete' and run_result.shutdown_latency is None:
+            problems.append('the run completed instead of being stopped')
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        passed = passed and not problems
+    return passed
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--folders', type=int, default=2500, help='Number of clip folders')
+    parser.add_argument('--segments', type=int, default=12, help='Segments per folder')
+    parser.add_argument('--duration', type=float, default=60.0, help='Reported clip duration')
+    parser.add_argument('--probe_latency', type=float, default=0.0, help='ffprobe latency')
+    parser.add_argument('--probe_failure_rate', type=float, default=0.0, help='ffprobe failure rate')
+    parser.add_argument('--encode_latency', type=float, default=0.0, help='ffmpeg latency')
+    parser.add_argument('--encode_failure_rate', type=float, default=0.0, help='ffmpeg failure rate')
+    parser.add_argument(
+        '--codec',
+        action='append',
+        choices=constants.CODEC_OPTIONS.keys(),
+        help='Codec whose encoder concurrency is used.  Repeat to pool several codecs',
+    )
+    parser.add_argument(
+        '--draft_first',
+        action='store_true',
+        help='Encode drafts first and full quality videos in the background',
+    )
+    parser.add_argument(
+        '--cancel_after',
+        type=float,
+        default=None,
+        help='Call shutdown() after this many seconds to measure cancellation latency',
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help=(
+            'Run small completion, failure and cancellation scenarios instead and exit non-zero '
+            'on out of order encoder grants or anything left running after shutdown()'
+        ),
+    )
+    args = parser.parse_args()
+
+    args.codec = args.codec or ['libx265']
+    logging.basicConfig(level=logging.CRITICAL)
+    if args.check:
+        passed = _check(args)
+    else:
+        measurement = _measure(args)
+        _report(args, measurement)
+        problems = _find_problems(args, measurement)
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        passed = not problems
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    _main()
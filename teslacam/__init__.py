@@ -2,3 +2,4 @@
 from .constants import DONT_REDUCE
 from .custom_types import FFMpegPaths, LayoutOptions, BaseFolderPaths
 from .extract import extract_videos
+from .planner import plan_videos
@@ -39,16 +39,24 @@ def main():
         arg_parser,
         constants,
         extract,
+        planner,
         time_duration
     )
 
-    log_level, extract_videos_arguments = arg_parser.get_arguments()
+    log_level, plan, extract_videos_arguments = arg_parser.get_arguments()
     logger = logging.getLogger(constants.LOGGER_NAME)
     teslacam_formatter = logging.Formatter(
         fmt='[%(asctime)s] %(message)s',
         datefmt='%H:%M:%S'
     )
     initialize_logger(logger, teslacam_formatter, log_level)
+    if plan:
+        # The plan only needs the ffmpeg paths, layout options and folder paths.  It is the
+        # command's output, so print it regardless of the log level
+        for line in planner.describe_plan(planner.plan_videos(*extract_videos_arguments[:3])):
+            print(line)
+        return
+
     def _extract_videos():
         try:
             extract.extract_videos(*extract_videos_arguments)
@@ -4,7 +4,8 @@ import pathlib
 
 from . import(
     constants,
-    custom_types
+    custom_types,
+    layout
 )
 
 def valid_percent(value):
@@ -35,6 +36,79 @@ def str_to_bool(value):
     raise argparse.ArgumentTypeError(f"invalid choice '{value}' (choose from {choices})")
 
 
+def codec_capacity(value):
+    ' Validate codec arguments with an optional encoder capacity, e.g. libx265:2 '
+    codec, _, capacity = value.partition(':')
+    if codec not in constants.CODEC_OPTIONS:
+        choices = quoted_choices(constants.CODEC_OPTIONS.keys())
+        raise argparse.ArgumentTypeError(f"invalid choice: '{codec}' (choose from {choices})")
+
+    if not capacity:
+        return codec, None
+
+    if not capacity.isdigit() or int(capacity) < 1:
+        raise argparse.ArgumentTypeError(f'{value} capacity must be a positive integer')
+    return codec, int(capacity)
+
+
+def get_codec(parser, args, preset_token):
+    ' Resolve codec arguments to a codec name or a dictionary of codec capacities '
+    if not args.codec:
+        args.codec = [('hevc_nvenc', None)]
+
+    for codec, _ in args.codec:
+        presets = constants.CODEC_OPTIONS[codec][0]
+        if args.preset not in presets:
+            choices = quoted_choices(presets)
+            parser.error(
+                f"argument {preset_token}: invalid choice for {codec}: '{args.preset}' "
+                f"(choose from {choices})"
+            )
+
+    if len(args.codec) == 1 and args.codec[0][1] is None:
+        return args.codec[0][0]
+
+    return {
+        codec: capacity or constants.CODEC_OPTIONS[codec][1]
+        for codec, capacity in args.codec
+    }
+
+
+def camera_list(value):
+    ' Split comma separated camera names '
+    cameras = tuple(camera.strip() for camera in value.split(',') if camera.strip())
+    if not cameras:
+        raise argparse.ArgumentTypeError('at least one camera must be specified')
+    return cameras
+
+
+def get_layout(parser, args):
+    ' Resolve the layout argument to a built in layout name or user layout offsets '
+    user_layout_offsets = {}
+    if args.layout_file:
+        try:
+            user_layout_offsets = layout.load_layout_offsets(args.layout_file)
+        except (OSError, ValueError) as layout_error:
+            parser.error(f'argument --layout_file: {layout_error}')
+    layout_offsets = {**constants.LAYOUT_OFFSETS, **user_layout_offsets}
+
+    if args.layout not in layout_offsets:
+        choices = quoted_choices(layout_offsets.keys())
+        parser.error(f"argument --layout: invalid choice: '{args.layout}' (choose from {choices})")
+
+    if args.cameras:
+        layout_cameras = layout.get_layout_cameras(layout_offsets[args.layout])
+        unknown_cameras = [camera for camera in args.cameras if camera not in layout_cameras]
+        if unknown_cameras:
+            choices = quoted_choices(layout_cameras)
+            parser.error(
+                f"argument --cameras: {quoted_choices(unknown_cameras)} not in layout "
+                f"'{args.layout}' (choose from {choices})"
+            )
+
+    return user_layout_offsets.get(args.layout, args.layout)
+
+
 def get_arguments():
     ' Parse command line arguments '
     parser = argparse.ArgumentParser(
@@ -63,9 +137,14 @@ def get_arguments():
     )
     parser.add_argument(
         '--codec',
-        default='hevc_nvenc',
-        help='Codec to use for encoding',
-        choices=constants.CODEC_OPTIONS.keys(),
+        action='append',
+        help=(
+            'Codec to use for encoding, optionally with an encoder capacity, e.g. libx265:2.  '
+            'Repeat to pool several codecs.  Each segment uses whichever codec is free first.  '
+            'Defaults to hevc_nvenc.  Codecs are '
+            f'{quoted_choices(constants.CODEC_OPTIONS.keys())}'
+        ),
+        type=codec_capacity,
     )
     preset_token = '--preset'
     parser.add_argument(
@@ -82,8 +161,29 @@ def get_arguments():
     parser.add_argument(
         '--layout',
         default='pyramid',
-        help='Camera layout',
-        choices=constants.LAYOUT_OFFSETS.keys(),
+        help=(
+            'Camera layout.  Built in layouts are '
+            f'{quoted_choices(constants.LAYOUT_OFFSETS.keys())}'
+        ),
+    )
+    parser.add_argument(
+        '--layout_file',
+        type=pathlib.Path,
+        help=(
+            'Path to a json file of additional layouts.  Each layout maps camera names '
+            'to [x, y] offsets in camera units, e.g. {"stacked": {"front": [0, 0], "back": [0, 1]}}'
+        ),
+    )
+    parser.add_argument(
+        '--cameras',
+        type=camera_list,
+        help='Comma separated cameras to include, e.g. front,back.  Defaults to every camera in the layout',
+    )
+    parser.add_argument(
+        '--compositor',
+        default='filter_graph',
+        help='Compositing backend.  numpy requires the numpy package',
+        choices=constants.COMPOSITORS,
     )
     parser.add_argument(
         '--keep_temp_folder',
@@ -91,6 +191,21 @@ def get_arguments():
         help='Keep temporary working folder after extraction',
         type=str_to_bool,
     )
+    # Draft first runs encode everything twice and are never measured, so they can't be planned
+    run_mode = parser.add_mutually_exclusive_group()
+    run_mode.add_argument(
+        '--draft_first',
+        action='store_true',
+        help=(
+            'Quickly create small drafts of every video first, then replace each draft with '
+            'the full quality video encoded at idle priority'
+        ),
+    )
+    run_mode.add_argument(
+        '--plan',
+        action='store_true',
+        help='Only probe the input videos and report the work, disk space and estimated time needed',
+    )
     parser.add_argument(
         '--log_level',
         default='info',
@@ -103,30 +218,30 @@ def get_arguments():
     )
     args = parser.parse_args()
 
-    presets = constants.CODEC_OPTIONS[args.codec][0]
-    if args.preset not in presets:
-        choices = quoted_choices(presets)
-        parser.error(
-            f"argument {preset_token}: invalid choice: '{args.preset}' (choose from {choices})"
-        )
+    codec = get_codec(parser, args, preset_token)
+    selected_layout = get_layout(parser, args)
 
     return (
         constants.LOG_LEVELS[args.log_level],
+        args.plan,
         (
             custom_types.FFMpegPaths(
                 args.ffprobe_file_path,
                 args.ffmpeg_file_path,
             ),
             custom_types.LayoutOptions(
-                args.codec,
+                codec,
                 args.preset,
-                args.layout,
+                selected_layout,
                 args.reduce,
+                args.compositor,
+                args.cameras,
             ),
             custom_types.BaseFolderPaths(
                 args.input_folder_path,
                 args.output_folder_path,
             ),
             args.keep_temp_folder,
+            args.draft_first,
         )
     )
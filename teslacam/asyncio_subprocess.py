@@ -1,24 +1,70 @@
 ' Asynchronous subprocess helpers '
 import asyncio
+import contextlib
+import contextvars
+import functools
 import logging
+import os
+import shutil
 import subprocess
 
 from . import constants
 
 LOGGER = logging.getLogger(constants.LOGGER_NAME)
 
+# Tasks inherit this, so everything started under low_priority() runs as background work
+_LOW_PRIORITY = contextvars.ContextVar('low_priority', default=False)
+
+@contextlib.contextmanager
+def low_priority():
+    ' Run processes started by the current task at idle cpu and io priority '
+    token = _LOW_PRIORITY.set(True)
+    try:
+        yield
+    finally:
+        _LOW_PRIORITY.reset(token)
+
+
+@functools.lru_cache(maxsize=None)
+def get_low_priority_cmd_line():
+    ' Look up the priority tools once and return the command line prefix that uses them '
+    # Use the standard tools where they exist rather than changing priority in a forked child
+    low_priority_cmd_line = []
+    for priority_cmd_line in (['nice', '-n', '19'], ['ionice', '-c', '3']):
+        priority_tool_path = shutil.which(priority_cmd_line[0])
+        if priority_tool_path:
+            low_priority_cmd_line += [priority_tool_path, *priority_cmd_line[1:]]
+    return tuple(low_priority_cmd_line)
+
+
+def prioritize(cmd_line):
+    ' Return the command line and process options for the current priority '
+    if not _LOW_PRIORITY.get():
+        return cmd_line, {}
+
+    if os.name == 'nt':
+        return cmd_line, {'creationflags': subprocess.IDLE_PRIORITY_CLASS}
+
+    return [*get_low_priority_cmd_line(), *cmd_line], {}
+
+
 async def _check_output(cmd_line, stdout):
     proc = None
     try:
+        cmd_line, process_options = prioritize(cmd_line)
         LOGGER.debug('running command line: %s', cmd_line)
         proc = await asyncio.create_subprocess_exec(
             *cmd_line,
-            stdout=stdout
+            stdout=stdout,
+            **process_options
         )
         await proc.wait()
         if proc.returncode:
             LOGGER.error('process %s failed', proc)
-            raise subprocess.CalledProcessError(proc.returncode, cmd=' '.join(cmd_line))
+            raise subprocess.CalledProcessError(
+                proc.returncode,
+                cmd=' '.join(str(token) for token in cmd_line)
+            )
 
         if proc.stdout:
             return await proc.stdout.read()
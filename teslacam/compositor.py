@@ -0,0 +1,221 @@
+' In-process compositing of raw camera frames '
+import asyncio
+import collections
+import logging
+import subprocess
+
+from . import(
+    asyncio_subprocess,
+    constants
+)
+
+LOGGER = logging.getLogger(constants.LOGGER_NAME)
+
+PIXEL_FORMAT = 'rgb24'
+BYTES_PER_PIXEL = 3
+
+CameraFrame = collections.namedtuple(
+    'CameraFrame',
+    [
+        'stream', # Decoder pipe producing raw frames
+        'view', # Where the camera sits in the canvas
+        'frame', # Contiguous frame that is copied into the view or None to read into the view
+        'frame_buffer', # Writable bytes of the frame or the view that each frame is read into
+    ]
+)
+
+
+def import_numpy():
+    ' Import numpy on demand since it is only needed by this compositor '
+    try:
+        import numpy #pylint: disable=import-outside-toplevel
+    except ImportError as import_error:
+        raise RuntimeError(
+            'the numpy compositor requires numpy (python -m pip install numpy)'
+        ) from import_error
+    return numpy
+
+
+def generate_decode_command_line(ffmpeg_file_path, video_camera_file_path, resolution):
+    ' FFMPEG command line that decodes a camera video into raw frames on stdout '
+    width, height = resolution
+    return [
+        ffmpeg_file_path,
+        '-v', 'error', # reduce output noise
+        '-i', video_camera_file_path,
+        '-vf', f'setpts=PTS-STARTPTS,scale={width}:{height}',
+        '-r', constants.FRAME_RATE,
+        '-f', 'rawvideo', '-pix_fmt', PIXEL_FORMAT,
+        'pipe:',
+    ]
+
+
+def generate_encode_command_line(
+        ffmpeg_file_path,
+        layout_options,
+        canvas_resolution,
+        layout_video_file_path
+):
+    ' FFMPEG command line that encodes raw canvas frames read from stdin '
+    width, height = canvas_resolution
+    cmd_line = [
+        ffmpeg_file_path,
+        '-v', 'error', # reduce output noise
+        '-f', 'rawvideo', '-pix_fmt', PIXEL_FORMAT,
+        '-s', f'{width}x{height}',
+        '-r', constants.FRAME_RATE,
+        '-i', 'pipe:',
+    ]
+    if layout_options.reduce != constants.DONT_REDUCE:
+        cmd_line += ['-vf', f'scale=iw*{layout_options.reduce}/100:-1:flags=bicubic']
+
+    cmd_line += [
+        '-c:v', layout_options.codec, '-preset', layout_options.preset,
+        '-b:v', constants.VIDEO_BITRATE,
+        *constants.SEGMENT_COMPATIBILITY_OPTIONS,
+        '-y', # overwrite existing file
+        layout_video_file_path,
+    ]
+    return cmd_line
+
+
+def create_camera_frame(numpy, stream, canvas, location, resolution):
+    ' Preallocate the buffer each frame of a camera is read into '
+    x_offset, y_offset = location
+    width, height = resolution
+    view = canvas[y_offset:y_offset + height, x_offset:x_offset + width]
+    if view.flags.c_contiguous:
+        # A camera spanning the whole canvas width is read straight into the canvas
+        return CameraFrame(stream, view, None, memoryview(view).cast('B'))
+    frame = numpy.empty_like(view)
+    return CameraFrame(stream, view, frame, memoryview(frame).cast('B'))
+
+
+def read_frame(camera_frame):
+    ' Read one frame into the canvas.  Returns False at the end of the stream '
+    # A buffered reader fills the whole frame in one call, looping over short pipe reads in C
+    # and reading straight into frame_buffer since it is larger than the reader's own buffer
+    frame_buffer = camera_frame.frame_buffer
+    if camera_frame.stream.readinto(frame_buffer) != len(frame_buffer):
+        return False
+    if camera_frame.frame is not None:
+        camera_frame.view[...] = camera_frame.frame
+    return True
+
+
+def composite_frames(camera_frames, canvas, encoder_stream, frame_callback):
+    ' Tile decoded frames into the canvas and stream each completed canvas to the encoder '
+    canvas_buffer = memoryview(canvas).cast('B')
+    active_camera_frames = list(camera_frames)
+    frame_index = 0
+    try:
+        while True:
+            # Walk backwards so cameras that run out can be removed in place
+            for camera_index in reversed(range(len(active_camera_frames))):
+                camera_frame = active_camera_frames[camera_index]
+                if not read_frame(camera_frame):
+                    # Show the background once a camera runs out, like overlay's eof_action=pass
+                    camera_frame.view.fill(0)
+                    del active_camera_frames[camera_index]
+
+            if not active_camera_frames:
+                break
+
+            if frame_callback:
+                frame_callback(canvas, frame_index)
+            encoder_stream.write(canvas_buffer)
+            frame_index += 1
+    except BrokenPipeError:
+        # The encoder exited early.  Its return code reports why
+        pass
+    return frame_index
+
+
+def check_return_code(proc, cmd_line):
+    ' Raise if a finished process failed '
+    if proc.returncode:
+        LOGGER.error('process %s failed', proc)
+        raise subprocess.CalledProcessError(
+            proc.returncode,
+            cmd=' '.join(str(token) for token in cmd_line)
+        )
+
+
+async def create_composite_video(
+        ffmpeg_file_path,
+        layout_options,
+        video_layout,
+        video_file_stream_info,
+        layout_video_file_path,
+        frame_callback=None
+):
+    ' Merge camera videos into one by compositing raw frames in a preallocated canvas '
+    # frame_callback(canvas, frame_index) may draw custom overlays onto the canvas in place
+    numpy = import_numpy()
+    canvas_width, canvas_height = video_layout['background']
+    canvas = numpy.zeros((canvas_height, canvas_width, BYTES_PER_PIXEL), dtype=numpy.uint8)
+
+    encode_cmd_line = generate_encode_command_line(
+        ffmpeg_file_path,
+        layout_options,
+        (canvas_width, canvas_height),
+        layout_video_file_path
+    )
+    procs = []
+    try:
+        camera_frames = []
+        for layer_name, video_camera_file_path in video_file_stream_info['cameras'].items():
+            resolution = video_file_stream_info['resolutions'][layer_name]
+            decode_cmd_line = generate_decode_command_line(
+                ffmpeg_file_path,
+                video_camera_file_path,
+                resolution
+            )
+            decode_cmd_line, process_options = asyncio_subprocess.prioritize(decode_cmd_line)
+            LOGGER.debug('running command line: %s', decode_cmd_line)
+            # Keep the default small read buffer so frames bypass it, see read_frame
+            decoder = subprocess.Popen(decode_cmd_line, stdout=subprocess.PIPE, **process_options)
+            procs.append((decoder, decode_cmd_line))
+            camera_frames.append(
+                create_camera_frame(
+                    numpy,
+                    decoder.stdout,
+                    canvas,
+                    video_layout[layer_name],
+                    resolution
+                )
+            )
+
+        encode_cmd_line, process_options = asyncio_subprocess.prioritize(encode_cmd_line)
+        LOGGER.debug('running command line: %s', encode_cmd_line)
+        encoder = subprocess.Popen(encode_cmd_line, stdin=subprocess.PIPE, **process_options)
+        procs.append((encoder, encode_cmd_line))
+
+        loop = asyncio.get_running_loop()
+        frame_count = await loop.run_in_executor(
+            None,
+            composite_frames,
+            camera_frames,
+            canvas,
+            encoder.stdin,
+            frame_callback
+        )
+        LOGGER.debug('composited %s frames for %s', frame_count, layout_video_file_path)
+        encoder.stdin.close()
+        # Check the encoder first since decoders can't finish once it stops reading
+        for proc, cmd_line in reversed(procs):
+            await loop.run_in_executor(None, proc.wait)
+            check_return_code(proc, cmd_line)
+
+    finally:
+        # Unblocks the compositing thread when cancelled or when a process fails
+        terminated_procs = []
+        for proc, _ in procs:
+            if proc.poll() is None:
+                LOGGER.debug('terminating process %s', proc)
+                proc.terminate()
+                terminated_procs.append(proc)
+        # Wait so no process still holds files when the working folder is removed
+        loop = asyncio.get_running_loop()
+        for proc in terminated_procs:
+            await loop.run_in_executor(None, proc.wait)
@@ -1,9 +1,8 @@
 ' Constants '
 import logging
 
-from . import layout
-
 # Except for background, the key names must match the file name suffixes for the camera data
+# Offsets are in camera units.  The canvas is sized to fit the cameras that are actually used
 LAYOUT_OFFSETS = {
     'pyramid': {
         'background': (3, 2),
@@ -32,11 +31,16 @@ LAYOUT_OFFSETS = {
         'right_repeater': (0, 1),
         'back': (1, 2),
         'left_repeater': (2, 1),
-    }
-}
-
-LAYOUT = {
-    name: layout.create_native_layout(offsets) for name, offsets in LAYOUT_OFFSETS.items()
+    },
+    'grid': {
+        'background': (3, 2),
+        'left_pillar': (0, 0),
+        'front': (1, 0),
+        'right_pillar': (2, 0),
+        'right_repeater': (0, 1),
+        'back': (1, 1),
+        'left_repeater': (2, 1),
+    },
 }
 
 NVIDIA_PRESETS = (
@@ -66,16 +70,56 @@ LIBX265_PRESETS = (
     'placebo',
 )
 
+LIBX264_PRESETS = LIBX265_PRESETS
+
+# Codecs that share a video format can be concatenated without re-encoding
 CODEC_OPTIONS = {
     'hevc_nvenc': (
         NVIDIA_PRESETS,
         2, # Typical nvidia GPUs only support 2 simultaneous executions
+        'hevc',
     ),
     'libx265': (
         LIBX265_PRESETS,
         1, # libx265 already runs in parallel.  no need to thrash the scheduler
-    )
+        'hevc',
+    ),
+    'libx264': (
+        LIBX264_PRESETS,
+        1, # libx264 already runs in parallel.  no need to thrash the scheduler
+        'h264',
+    ),
+}
+
+# Fastest preset of each codec and the size reduction used for draft videos
+DRAFT_PRESETS = {
+    'hevc_nvenc': 'llhp',
+    'libx265': 'ultrafast',
+    'libx264': 'ultrafast',
 }
+DRAFT_REDUCE = 25
+
+# Both compositors encode segments with these so their output can't drift apart
+FRAME_RATE = '36' # average frame rate based on existing tesla cam videos
+VIDEO_BITRATE = '8M' # pick a bitrate that's friendly to 1280x960 video
+
+# Segments from different encoders share a pixel format and repeat their own parameter sets
+# on every keyframe, so they still decode correctly after being concatenated without re-encoding
+SEGMENT_COMPATIBILITY_OPTIONS = (
+    '-pix_fmt', 'yuv420p',
+    '-bsf:v', 'dump_extra=freq=keyframe',
+)
+
+# filter_graph overlays cameras inside ffmpeg.  numpy tiles raw frames in python
+COMPOSITORS = (
+    'filter_graph',
+    'numpy',
+)
+
+# Segments are encoded at VIDEO_BITRATE.  Used when no earlier run measured disk usage
+DEFAULT_BYTES_PER_SECOND = 8_000_000 // 8
+
+THROUGHPUT_FILE_NAME = 'teslacam_throughput.json'
 
 DONT_REDUCE = 100 # Reduction factor when you don't want to reduce by anything
 
@@ -4,11 +4,14 @@ import collections
 LayoutOptions = collections.namedtuple(
     'LayoutOptions',
     [
-        'codec', # Codec as a string
-        'preset', # Codec preset as a string
-        'layout', # Layout name as a string
+        'codec', # Codec as a string, or a dictionary of codecs to encoder capacities
+        'preset', # Codec preset as a string, or a dictionary of codecs to presets
+        'layout', # Layout name as a string or a dictionary of camera offsets
         'reduce', # Percentage value from 1 to 100 as a float
-    ]
+        'compositor', # Compositor name as a string
+        'cameras', # Camera names to include or None for every camera in the layout
+    ],
+    defaults=('filter_graph', None)
 )
 
 # All structures here hold full filepaths
@@ -26,3 +29,15 @@ BaseFolderPaths = collections.namedtuple(
     'BaseFolderPaths',
     ['input', 'output']
 )
+
+Plan = collections.namedtuple(
+    'Plan',
+    [
+        'folders', # Number of folders that produce a video
+        'segments', # Number of layout segments to encode
+        'footage_seconds', # Total seconds of footage as a float
+        'peak_scratch_bytes', # Temporary work folder size at the end of the run
+        'output_bytes', # Total size of the merged videos
+        'estimated_seconds', # Estimated wall time or None without an earlier run to calibrate it
+    ]
+)
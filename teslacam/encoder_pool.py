@@ -0,0 +1,138 @@
+' Encoder slots shared across one or more codecs '
+import asyncio
+import collections
+import contextlib
+
+from . import constants
+
+def get_codec_capacities(codec):
+    ' Normalize a codec name, a sequence of codec names or a dictionary of codec capacities '
+    if isinstance(codec, str):
+        codec = (codec,)
+    if isinstance(codec, dict):
+        return dict(codec)
+    return {codec_name: constants.CODEC_OPTIONS[codec_name][1] for codec_name in codec}
+
+
+def get_codec_format(codec_name):
+    ' Return the video format a codec produces '
+    return constants.CODEC_OPTIONS[codec_name][2]
+
+
+def get_primary_format(codec):
+    ' Joined videos use the format of the first codec '
+    return get_codec_format(next(iter(get_codec_capacities(codec))))
+
+
+def get_format_codecs(codec, video_format):
+    ' Return the pooled codecs that produce a video format '
+    return tuple(
+        codec_name for codec_name in get_codec_capacities(codec)
+        if get_codec_format(codec_name) == video_format
+    )
+
+
+def get_codec_preset(preset, codec_name):
+    ' Presets are either shared by every codec or given per codec as a dictionary '
+    if isinstance(preset, dict):
+        return preset[codec_name]
+    return preset
+
+
+class EncoderPool:
+    ' Hands out encoder slots.  Each request gets whichever allowed codec frees up a slot first '
+    def __init__(self, codec_capacities):
+        self.free_slots = dict(codec_capacities)
+        # (allowed codec names, future) for every request that found no free slot, oldest first
+        self.waiters = collections.deque()
+
+    def take_free_slot(self, codec_names):
+        ' Take a free slot of one of the codecs without waiting or return None '
+        for codec_name in codec_names:
+            if self.free_slots.get(codec_name):
+                self.free_slots[codec_name] -= 1
+                return codec_name
+        return None
+
+    async def take(self, codec_names=None):
+        ' Wait for a slot of one of the codecs, or of any codec, and return its codec name '
+        if codec_names is None:
+            codec_names = tuple(self.free_slots)
+        # A free slot is never wanted by a waiting request, so taking it doesn't jump the queue
+        codec_name = self.take_free_slot(codec_names)
+        if codec_name:
+            return codec_name
+
+        waiter = (codec_names, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        try:
+            return await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled():
+                # The slot was handed over just as the request was cancelled
+                self.put(waiter[1].result())
+            else:
+                self.waiters.remove(waiter)
+            raise
+
+    def put(self, codec_name):
+        ' Return a slot, handing it straight to the oldest request that accepts its codec '
+        for waiter in self.waiters:
+            codec_names, future = waiter
+            if codec_name in codec_names and not future.done():
+                self.waiters.remove(waiter)
+                future.set_result(codec_name)
+                return
+        self.free_slots[codec_name] += 1
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, codec_names=None):
+        ' Wait for a free slot and yield the name of the codec that owns it '
+        codec_name = await self.take(codec_names)
+        try:
+            yield codec_name
+        finally:
+            self.put(codec_name)
+
+
+class DraftGate:
+    ' Tracks pending draft work so background work can yield to it '
+    def __init__(self):
+        self.pending_drafts = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    @contextlib.contextmanager
+    def draft(self):
+        ' Mark draft work as pending until the block exits '
+        self.pending_drafts += 1
+        self.idle.clear()
+        try:
+            yield
+        finally:
+            self.pending_drafts -= 1
+            if not self.pending_drafts:
+                self.idle.set()
+
+
+class BackgroundEncoderPool:
+    ' Shares an encoder pool but only asks for a slot while no draft work is pending '
+    def __init__(self, encoder_pool, draft_gate):
+        self.encoder_pool = encoder_pool
+        self.draft_gate = draft_gate
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, codec_names=None):
+        ' Wait for draft work to finish, then for a free slot '
+        while True:
+            await self.draft_gate.idle.wait()
+            codec_name = await self.encoder_pool.take(codec_names)
+            if self.draft_gate.idle.is_set():
+                break
+            # Draft work arrived while waiting for the slot, so hand it over
+            self.encoder_pool.put(codec_name)
+
+        try:
+            yield codec_name
+        finally:
+            self.encoder_pool.put(codec_name)
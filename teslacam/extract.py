@@ -8,11 +8,16 @@ import pathlib
 import re
 import subprocess
 import tempfile
+import time
 
 from . import(
     asyncio_subprocess,
+    compositor,
     constants,
-    custom_types
+    custom_types,
+    encoder_pool,
+    layout,
+    throughput
 )
 
 LOGGER = logging.getLogger(constants.LOGGER_NAME)
@@ -30,7 +35,8 @@ async def get_video_stream_info(ffprobe_file_path, video_file_path):
     ffprobe_cmd_line = [
         ffprobe_file_path,
         '-v', 'error',
-        '-show_entries', 'stream=duration',
+        '-select_streams', 'v:0', # only the video stream has dimensions
+        '-show_entries', 'stream=duration,width,height',
         '-print_format', 'json',
         '-i', video_file_path,
     ]
@@ -38,7 +44,8 @@ async def get_video_stream_info(ffprobe_file_path, video_file_path):
     data = await asyncio_subprocess.check_output(ffprobe_cmd_line)
     LOGGER.debug('completed gathering video stream info from %s', video_file_path)
 
-    return json.loads(data)['streams'][0]
+    streams = json.loads(data)['streams']
+    return streams[0] if streams else {}
 
 
 def get_longest_duration(existing_duration, new_duration):
@@ -58,7 +65,8 @@ async def populate_video_map(
         video_map,
         ffprobe_file_path,
         acquire_probe,
-        video_file_path
+        video_file_path,
+        cameras
 ):
     ' Retrieve video metadata from raw video files '
     match_result = re.fullmatch(REGEX_VIDEO_FILENAME, video_file_path.name)
@@ -66,6 +74,11 @@ async def populate_video_map(
         LOGGER.info('skip %s because it does not look like a video file', video_file_path)
         return
 
+    video_file_camera_position = match_result.group(2)
+    if video_file_camera_position not in cameras:
+        LOGGER.debug('skip %s because its camera is not selected', video_file_path)
+        return
+
     async with acquire_probe:
         try:
             video_stream_info = await get_video_stream_info(
@@ -77,6 +90,10 @@ async def populate_video_map(
                 LOGGER.warning('skip %s because it contains no streams', video_file_path)
                 return
 
+            if 'width' not in video_stream_info or 'height' not in video_stream_info:
+                LOGGER.warning('skip %s because its stream has no dimensions', video_file_path)
+                return
+
         except subprocess.CalledProcessError as proc_error:
             LOGGER.warning(
                 'skip %s because it ran into the following exception: %s',
@@ -88,10 +105,15 @@ async def populate_video_map(
     video_file_prefix = match_result.group(1)
     video_file_metadata = video_map.setdefault(video_file_prefix, {})
 
-    video_file_camera_position = match_result.group(2)
     video_file_camera = video_file_metadata.setdefault('cameras', {})
     video_file_camera[video_file_camera_position] = video_file_path
 
+    video_file_resolution = video_file_metadata.setdefault('resolutions', {})
+    video_file_resolution[video_file_camera_position] = (
+        int(video_stream_info['width']),
+        int(video_stream_info['height']),
+    )
+
     video_file_metadata['duration'] = get_longest_duration(
         video_file_metadata.setdefault('duration', '0'),
         video_stream_info['duration']
@@ -101,7 +123,8 @@ async def populate_video_map(
 async def create_video_file_map(
         ffprobe_file_path,
         acquire_probe,
-        input_folder_path
+        input_folder_path,
+        cameras
 ):
     ' Enumerates video folder to find files to layout and concatenate '
     video_file_paths = input_folder_path.iterdir()
@@ -113,7 +136,8 @@ async def create_video_file_map(
                 video_map,
                 ffprobe_file_path,
                 acquire_probe,
-                video_file_path
+                video_file_path,
+                cameras
             )
             for video_file_path in video_file_paths
         )
@@ -122,6 +146,31 @@ async def create_video_file_map(
     return video_map
 
 
+def get_layout_offsets(layout_name_or_offsets):
+    ' Return the camera offsets for a built in layout name or user supplied offsets '
+    if isinstance(layout_name_or_offsets, str):
+        return constants.LAYOUT_OFFSETS[layout_name_or_offsets]
+    return layout_name_or_offsets
+
+
+def get_selected_cameras(layout_options):
+    ' Return the cameras to decode.  Cameras outside of the layout are never opened '
+    layout_cameras = layout.get_layout_cameras(get_layout_offsets(layout_options.layout))
+    if layout_options.cameras is None:
+        return set(layout_cameras)
+    return set(layout_options.cameras).intersection(layout_cameras)
+
+
+def create_video_layout(video_file_map, layout_offsets):
+    ' Create one layout for a folder so every segment shares a canvas and can be concatenated '
+    camera_resolutions = {}
+    for video_file_stream_info in video_file_map.values():
+        for camera, (width, height) in video_file_stream_info['resolutions'].items():
+            existing_width, existing_height = camera_resolutions.get(camera, (0, 0))
+            camera_resolutions[camera] = (max(existing_width, width), max(existing_height, height))
+    return layout.create_bounding_layout(camera_resolutions, layout_offsets)
+
+
 def create_camera_filter_layer(stream_id, location):
     ' Create an ffmpeg filter layer '
     # Create a name for the previous layer and the camera layer
@@ -144,12 +193,12 @@ def create_scale_filter(reduce_percentage):
 def generate_layout_command_line(
         ffmpeg_file_path,
         layout_options,
+        video_layout,
         video_file_stream_info,
         layout_video_file_path
 ):
     ' FFMPEG command line that merges camera videos into one '
-    layout = constants.LAYOUT[layout_options.layout]
-    background_width, background_height = layout['background']
+    background_width, background_height = video_layout['background']
     ffmpeg_filter = f'color=duration={video_file_stream_info["duration"]}:' + \
                     f's={background_width}x{background_height}:' + \
                     'c=black'
@@ -157,7 +206,7 @@ def generate_layout_command_line(
     cmd_line = [ffmpeg_file_path]
     for stream_id, camera_info in enumerate(video_file_stream_info['cameras'].items()):
         layer_name, video_camera_file_path = camera_info
-        ffmpeg_filter += create_camera_filter_layer(stream_id, layout[layer_name])
+        ffmpeg_filter += create_camera_filter_layer(stream_id, video_layout[layer_name])
         cmd_line += ['-i', video_camera_file_path]
 
     ffmpeg_filter += create_scale_filter(layout_options.reduce)
@@ -165,8 +214,9 @@ def generate_layout_command_line(
     cmd_line += [
         '-filter_complex', ffmpeg_filter,
         '-c:v', layout_options.codec, '-preset', layout_options.preset,
-        '-b:v', '8M', # pick a bitrate that's friendly to 1280x960 video
-        '-r', '36',  # average frame rate based on existing tesla cam videos
+        '-b:v', constants.VIDEO_BITRATE,
+        *constants.SEGMENT_COMPATIBILITY_OPTIONS,
+        '-r', constants.FRAME_RATE,
         '-v', 'error', # reduce output noise
         '-y', # overwrite existing file
         layout_video_file_path,
@@ -183,6 +233,7 @@ async def create_layout_video_process(
         video_file_info,
         ffmpeg_file_path,
         layout_options,
+        video_layout,
         working_layout_folder_path,
 ):
     ' FFMPEG process to merge camera video segments into one video segment '
@@ -191,14 +242,24 @@ async def create_layout_video_process(
         video_file_info[0]
     )
     video_file_stream_info = video_file_info[1]
-    cmd_line = generate_layout_command_line(
-        ffmpeg_file_path,
-        layout_options,
-        video_file_stream_info,
-        layout_video_file_path
-    )
     LOGGER.info('creating layout video %s', layout_video_file_path)
-    await asyncio_subprocess.check_call(cmd_line)
+    if layout_options.compositor == 'numpy':
+        await compositor.create_composite_video(
+            ffmpeg_file_path,
+            layout_options,
+            video_layout,
+            video_file_stream_info,
+            layout_video_file_path
+        )
+    else:
+        cmd_line = generate_layout_command_line(
+            ffmpeg_file_path,
+            layout_options,
+            video_layout,
+            video_file_stream_info,
+            layout_video_file_path
+        )
+        await asyncio_subprocess.check_call(cmd_line)
     LOGGER.info('finished layout video %s', layout_video_file_path)
 
 
@@ -207,16 +268,22 @@ async def create_layout_video(
         ffmpeg_file_path,
         acquire_encoder,
         layout_options,
+        video_layout,
         working_layout_folder_path
 ):
-    ' Create a layout video that merges all the cameras '
-    async with acquire_encoder:
+    ' Create a layout video that merges all the cameras and return the codec that encoded it '
+    async with acquire_encoder.acquire() as codec:
         await create_layout_video_process(
             video_file_info,
             ffmpeg_file_path,
-            layout_options,
+            layout_options._replace(
+                codec=codec,
+                preset=encoder_pool.get_codec_preset(layout_options.preset, codec)
+            ),
+            video_layout,
             working_layout_folder_path
         )
+    return codec
 
 
 async def create_layout_videos(
@@ -224,16 +291,18 @@ async def create_layout_videos(
         ffmpeg_file_path,
         acquire_encoder,
         layout_options,
+        video_layout,
         working_layout_folder_path
 ):
-    ' Create multiple layout videos concurrently '
-    await asyncio.gather(
+    ' Create multiple layout videos concurrently and return the codec that encoded each '
+    return await asyncio.gather(
         *(
             create_layout_video(
                 video_file_info,
                 ffmpeg_file_path,
                 acquire_encoder,
                 layout_options,
+                video_layout,
                 working_layout_folder_path,
             )
             for video_file_info in video_file_info_list
@@ -241,6 +310,50 @@ async def create_layout_videos(
     )
 
 
+def generate_transcode_command_line(
+        ffmpeg_file_path,
+        layout_options,
+        layout_video_file_path,
+        transcoded_video_file_path
+):
+    ' FFMPEG command line that re-encodes a layout video with another codec '
+    return [
+        ffmpeg_file_path,
+        '-v', 'error', # reduce output noise
+        '-i', layout_video_file_path,
+        '-c:v', layout_options.codec, '-preset', layout_options.preset,
+        '-b:v', constants.VIDEO_BITRATE,
+        *constants.SEGMENT_COMPATIBILITY_OPTIONS,
+        '-y', # overwrite existing file
+        transcoded_video_file_path,
+    ]
+
+
+async def transcode_layout_video(
+        ffmpeg_file_path,
+        acquire_encoder,
+        layout_options,
+        video_format,
+        layout_video_file_path
+):
+    ' Re-encode a layout video into a format so it can be concatenated with the others '
+    transcoded_video_file_path = layout_video_file_path.with_suffix(f'.{video_format}.mp4')
+    codec_names = encoder_pool.get_format_codecs(layout_options.codec, video_format)
+    async with acquire_encoder.acquire(codec_names) as codec:
+        cmd_line = generate_transcode_command_line(
+            ffmpeg_file_path,
+            layout_options._replace(
+                codec=codec,
+                preset=encoder_pool.get_codec_preset(layout_options.preset, codec)
+            ),
+            layout_video_file_path,
+            transcoded_video_file_path
+        )
+        LOGGER.info('transcoding layout video %s to %s', layout_video_file_path, video_format)
+        await asyncio_subprocess.check_call(cmd_line)
+    os.replace(transcoded_video_file_path, layout_video_file_path)
+
+
 async def create_file_manifest(video_file_map, working_layout_folder_path):
     ' Create an ffmpeg file manifest for merging '
     manifest_file_path = working_layout_folder_path / 'concat_manifest.txt'
@@ -271,67 +384,197 @@ async def concatenate_layout_videos(ffmpeg_file_path, manifest_file_path, output
     LOGGER.info('concatenation completed for %s', output_file_path)
 
 
+def get_footage_seconds(video_file_map):
+    ' Total seconds of footage in a folder '
+    return sum(
+        float(video_file_stream_info['duration'])
+        for video_file_stream_info in video_file_map.values()
+    )
+
+
+def create_draft_layout_options(layout_options):
+    ' Layout options for a quick draft using the fastest preset of every codec at a reduced size '
+    return layout_options._replace(
+        preset={
+            codec: constants.DRAFT_PRESETS[codec]
+            for codec in encoder_pool.get_codec_capacities(layout_options.codec)
+        },
+        reduce=min(layout_options.reduce, constants.DRAFT_REDUCE),
+    )
+
+
+async def merge_video_file_map(
+        ffmpeg_file_path,
+        acquire_encoder,
+        layout_options,
+        video_file_map,
+        working_layout_folder_path,
+        output_file_path
+):
+    ' Lay out every segment of a folder and join them into one video '
+    video_layout = create_video_layout(
+        video_file_map,
+        get_layout_offsets(layout_options.layout)
+    )
+    working_layout_folder_path.mkdir(parents=True)
+
+    codecs = await create_layout_videos(
+        video_file_map.items(),
+        ffmpeg_file_path,
+        acquire_encoder,
+        layout_options,
+        video_layout,
+        working_layout_folder_path
+    )
+
+    # Concatenating without re-encoding needs one format, so pools that mix formats re-encode
+    # only the segments a codec of another format produced.  Those take pool slots too
+    video_format = encoder_pool.get_primary_format(layout_options.codec)
+    await asyncio.gather(
+        *(
+            transcode_layout_video(
+                ffmpeg_file_path,
+                acquire_encoder,
+                layout_options,
+                video_format,
+                create_layout_video_file_path(working_layout_folder_path, file_basename)
+            )
+            for file_basename, codec in zip(video_file_map, codecs)
+            if encoder_pool.get_codec_format(codec) != video_format
+        )
+    )
+
+    manifest_file_path = await create_file_manifest(
+        video_file_map,
+        working_layout_folder_path
+    )
+    await concatenate_layout_videos(ffmpeg_file_path, manifest_file_path, output_file_path)
+
+
 async def create_video_file(
         ffmpeg_paths,
         resource_acquire,
         layout_options,
         working_folder_paths,
 ):
-    ' Merge a single folder of videos into one continuous video '
+    ' Merge a single folder of videos into one continuous video and return its footage seconds '
     video_file_map = await create_video_file_map(
         ffmpeg_paths.ffprobe,
         resource_acquire.probe,
-        working_folder_paths.input
+        working_folder_paths.input,
+        get_selected_cameras(layout_options)
     )
     if not video_file_map:
-        return
+        return 0
 
     base_name = working_folder_paths.input.name
-    working_layout_folder_path = working_folder_paths.intermediate / base_name
-    working_layout_folder_path.mkdir()
-
-    await create_layout_videos(
-        video_file_map.items(),
+    await merge_video_file_map(
         ffmpeg_paths.ffmpeg,
         resource_acquire.encoder,
         layout_options,
-        working_layout_folder_path
-    )
-    manifest_file_path = await create_file_manifest(
         video_file_map,
-        working_layout_folder_path
+        working_folder_paths.intermediate / base_name,
+        working_folder_paths.output / f'{base_name}.mp4'
     )
+    return get_footage_seconds(video_file_map)
 
+
+async def create_draft_first_video_file(
+        ffmpeg_paths,
+        resource_acquire,
+        draft_gate,
+        layout_options,
+        working_folder_paths,
+):
+    ' Merge a folder into a quick draft, then replace it with a full quality background encode '
+    base_name = working_folder_paths.input.name
+    working_layout_folder_path = working_folder_paths.intermediate / base_name
     output_file_path = working_folder_paths.output / f'{base_name}.mp4'
-    await concatenate_layout_videos(ffmpeg_paths.ffmpeg, manifest_file_path, output_file_path)
+    with draft_gate.draft():
+        video_file_map = await create_video_file_map(
+            ffmpeg_paths.ffprobe,
+            resource_acquire.probe,
+            working_folder_paths.input,
+            get_selected_cameras(layout_options)
+        )
+        if not video_file_map:
+            return 0
+
+        await merge_video_file_map(
+            ffmpeg_paths.ffmpeg,
+            resource_acquire.encoder,
+            create_draft_layout_options(layout_options),
+            video_file_map,
+            working_layout_folder_path / 'draft',
+            output_file_path
+        )
+    LOGGER.info('draft ready for %s', output_file_path)
+
+    # Write the final video in the working folder, which is on the same drive as the draft so
+    # it can replace the draft in one step and is cleaned up with the rest if the encode fails
+    final_file_path = working_layout_folder_path / f'{base_name}.mp4'
+    with asyncio_subprocess.low_priority():
+        await merge_video_file_map(
+            ffmpeg_paths.ffmpeg,
+            encoder_pool.BackgroundEncoderPool(resource_acquire.encoder, draft_gate),
+            layout_options,
+            video_file_map,
+            working_layout_folder_path / 'final',
+            final_file_path
+        )
+
+    try:
+        os.replace(final_file_path, output_file_path)
+        LOGGER.info('replaced draft with final video for %s', output_file_path)
+    except PermissionError:
+        # Windows refuses to replace a draft that is still open in a player, so keep the final
+        # video beside it rather than in the working folder that is about to be removed
+        kept_file_path = working_folder_paths.output / f'{base_name}.final.mp4'
+        os.replace(final_file_path, kept_file_path)
+        LOGGER.warning(
+            'keep final video as %s because %s is in use',
+            kept_file_path,
+            output_file_path
+        )
+    return get_footage_seconds(video_file_map)
 
 
 async def create_video_files(
         ffmpeg_paths,
         layout_options,
         working_folder_paths,
+        draft_first=False,
 ):
     ' Concurrently merge multiple folders of videos into individual continuous videos '
     # Limit resources using semaphores to stop exhaustion and thrashing
     resource_acquire = ResourceAcquire(
         asyncio.Semaphore(os.cpu_count()),
-        asyncio.Semaphore(constants.CODEC_OPTIONS[layout_options.codec][1]),
+        encoder_pool.EncoderPool(encoder_pool.get_codec_capacities(layout_options.codec)),
     )
-    await asyncio.gather(
-        *(
-            create_video_file(
+    draft_gate = encoder_pool.DraftGate()
+    def _create_video_file(input_folder_path):
+        folder_paths = custom_types.WorkingFolderPaths(
+            input_folder_path,
+            working_folder_paths.output,
+            working_folder_paths.intermediate,
+        )
+        if draft_first:
+            return create_draft_first_video_file(
                 ffmpeg_paths,
                 resource_acquire,
+                draft_gate,
                 layout_options,
-                custom_types.WorkingFolderPaths(
-                    input_folder_path,
-                    working_folder_paths.output,
-                    working_folder_paths.intermediate,
-                )
+                folder_paths
             )
+        return create_video_file(ffmpeg_paths, resource_acquire, layout_options, folder_paths)
+
+    footage_seconds = await asyncio.gather(
+        *(
+            _create_video_file(input_folder_path)
             for input_folder_path in working_folder_paths.input.iterdir()
         )
     )
+    return sum(footage_seconds)
 
 
 async def shutdown():
@@ -353,22 +596,36 @@ def extract_videos(
         layout_options,
         base_folder_paths,
         keep_temp_folder,
+        draft_first=False,
 ):
     ' Extract videos from a folder using a temporary work area '
     async def _async_extract(intermediate_folder_path):
+        start_time = time.perf_counter()
         try:
-            await create_video_files(
+            footage_seconds = await create_video_files(
                 ffmpeg_paths,
                 layout_options,
                 custom_types.WorkingFolderPaths(
                     *base_folder_paths,
                     intermediate_folder_path,
                 ),
+                draft_first,
             )
         except Exception:
             await shutdown()
             raise
 
+        # Calibrate future plans while the work folder still holds every segment
+        # Draft first runs encode everything twice so they would skew the estimates
+        if footage_seconds and not draft_first:
+            throughput.record_throughput(
+                base_folder_paths.output,
+                layout_options,
+                footage_seconds,
+                time.perf_counter() - start_time,
+                throughput.get_folder_size(intermediate_folder_path)
+            )
+
     if keep_temp_folder:
         intermediate_folder_path = pathlib.Path(tempfile.mkdtemp(dir=base_folder_paths.output))
         asyncio.run(_async_extract(intermediate_folder_path))
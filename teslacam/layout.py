@@ -1,4 +1,6 @@
 ' Create video layouts '
+import itertools
+import json
 
 def create_layout(video_resolution, layout_offsets):
     ' Create layout using resolution and layout offsets '
@@ -10,7 +12,116 @@ def create_layout(video_resolution, layout_offsets):
     return resolved_layout
 
 
-def create_native_layout(layout_offsets):
-    ' Create layout using layout offsets '
-    camera_native_resolution = (1280, 960)
-    return create_layout(camera_native_resolution, layout_offsets)
+def get_layout_cameras(layout_offsets):
+    ' Return the camera names placed by layout offsets '
+    return [layer_name for layer_name in layout_offsets if layer_name != 'background']
+
+
+def round_up_to_even(value):
+    ' Most encoders require even frame dimensions '
+    return value + value % 2
+
+
+def create_track_starts(offset_sizes):
+    ' Place grid columns or rows of (offset, size) pairs next to each other '
+    track_sizes = {}
+    for offset, size in offset_sizes:
+        track_sizes[offset] = max(track_sizes.get(offset, 0), size)
+    track_offsets = sorted(track_sizes)
+    track_starts = itertools.accumulate(
+        (track_sizes[offset] for offset in track_offsets[:-1]),
+        initial=0
+    )
+    return dict(zip(track_offsets, track_starts))
+
+
+def create_compact_offsets(offsets):
+    ' Map camera unit offsets so bands of the canvas that no camera covers are removed '
+    compact_offsets = {}
+    covered_end = min(offsets)
+    removed = covered_end
+    for offset in sorted(set(offsets)):
+        # Each camera covers one unit starting at its offset
+        if offset > covered_end:
+            removed += offset - covered_end
+        compact_offsets[offset] = offset - removed
+        covered_end = max(covered_end, offset + 1)
+    return compact_offsets
+
+
+def create_bounding_layout(camera_resolutions, layout_offsets):
+    ' Create the smallest layout that fits only the given cameras at their own resolutions '
+    cameras = [
+        camera for camera in get_layout_cameras(layout_offsets) if camera in camera_resolutions
+    ]
+    if not cameras:
+        raise ValueError('none of the cameras are placed by the layout')
+
+    if all(float(offset).is_integer() for camera in cameras for offset in layout_offsets[camera]):
+        # Size each grid column and row from the cameras in it so mixed resolutions leave no gaps
+        column_starts = create_track_starts(
+            (layout_offsets[camera][0], camera_resolutions[camera][0]) for camera in cameras
+        )
+        row_starts = create_track_starts(
+            (layout_offsets[camera][1], camera_resolutions[camera][1]) for camera in cameras
+        )
+        locations = {}
+        for camera in cameras:
+            x_offset, y_offset = layout_offsets[camera]
+            locations[camera] = (column_starts[x_offset], row_starts[y_offset])
+    else:
+        # Fractional offsets straddle columns, so use cells the size of the largest camera and
+        # drop the bands that only unselected cameras covered
+        cell_width = max(camera_resolutions[camera][0] for camera in cameras)
+        cell_height = max(camera_resolutions[camera][1] for camera in cameras)
+        compact_x_offsets = create_compact_offsets(
+            [layout_offsets[camera][0] for camera in cameras]
+        )
+        compact_y_offsets = create_compact_offsets(
+            [layout_offsets[camera][1] for camera in cameras]
+        )
+        locations = create_layout(
+            (cell_width, cell_height),
+            {
+                camera: (
+                    compact_x_offsets[layout_offsets[camera][0]],
+                    compact_y_offsets[layout_offsets[camera][1]],
+                )
+                for camera in cameras
+            }
+        )
+
+    resolved_layout = dict(locations)
+    resolved_layout['background'] = (
+        round_up_to_even(max(
+            resolved_layout[camera][0] + camera_resolutions[camera][0] for camera in cameras
+        )),
+        round_up_to_even(max(
+            resolved_layout[camera][1] + camera_resolutions[camera][1] for camera in cameras
+        )),
+    )
+    return resolved_layout
+
+
+def load_layout_offsets(layout_file_path):
+    ' Load user layouts from a json file mapping layout names to camera offsets '
+    with open(layout_file_path) as layout_file:
+        layouts = json.load(layout_file)
+
+    if not isinstance(layouts, dict):
+        raise ValueError(f'{layout_file_path} must map layout names to camera offsets')
+
+    layout_offsets = {}
+    for layout_name, offsets in layouts.items():
+        if not isinstance(offsets, dict) or not offsets:
+            raise ValueError(f'layout {layout_name} must map camera names to offsets')
+
+        layout_offsets[layout_name] = {}
+        for camera, camera_offsets in offsets.items():
+            if not isinstance(camera_offsets, list) or len(camera_offsets) != 2 or \
+                    not all(isinstance(offset, (int, float)) for offset in camera_offsets):
+                raise ValueError(
+                    f'camera {camera} in layout {layout_name} must have an [x, y] offset'
+                )
+            layout_offsets[layout_name][camera] = tuple(camera_offsets)
+    return layout_offsets
@@ -0,0 +1,85 @@
+' Estimate how long an extraction takes and how much disk it needs without encoding '
+import asyncio
+import os
+
+from . import(
+    constants,
+    custom_types,
+    extract,
+    throughput,
+    time_duration
+)
+
+async def create_plan(ffprobe_file_path, layout_options, base_folder_paths):
+    ' Enumerate and probe every folder the same way extraction does '
+    acquire_probe = asyncio.Semaphore(os.cpu_count())
+    cameras = extract.get_selected_cameras(layout_options)
+    video_file_maps = await asyncio.gather(
+        *(
+            extract.create_video_file_map(
+                ffprobe_file_path,
+                acquire_probe,
+                input_folder_path,
+                cameras
+            )
+            for input_folder_path in base_folder_paths.input.iterdir()
+        )
+    )
+    video_file_maps = [video_file_map for video_file_map in video_file_maps if video_file_map]
+    footage_seconds = sum(
+        extract.get_footage_seconds(video_file_map) for video_file_map in video_file_maps
+    )
+
+    totals = throughput.load_throughputs(base_folder_paths.output).get(
+        throughput.get_throughput_key(layout_options)
+    )
+    estimated_seconds = None
+    bytes_per_second = constants.DEFAULT_BYTES_PER_SECOND
+    if totals and totals['footage_seconds']:
+        estimated_seconds = footage_seconds * totals['elapsed_seconds'] / totals['footage_seconds']
+        bytes_per_second = totals['scratch_bytes'] / totals['footage_seconds']
+
+    # Every segment stays in the work folder until the run ends and the merged videos copy them
+    scratch_bytes = int(footage_seconds * bytes_per_second)
+    return custom_types.Plan(
+        len(video_file_maps),
+        sum(len(video_file_map) for video_file_map in video_file_maps),
+        footage_seconds,
+        scratch_bytes,
+        scratch_bytes,
+        estimated_seconds,
+    )
+
+
+def plan_videos(
+        ffmpeg_paths,
+        layout_options,
+        base_folder_paths,
+):
+    ' Return a plan for extracting videos from a folder '
+    return asyncio.run(create_plan(ffmpeg_paths.ffprobe, layout_options, base_folder_paths))
+
+
+def format_bytes(byte_count):
+    ' Format a byte count using binary units '
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if byte_count < 1024:
+            return f'{byte_count:.1f} {unit}'
+        byte_count /= 1024
+    return f'{byte_count:.1f} TiB'
+
+
+def describe_plan(plan):
+    ' Return printable lines for a plan '
+    if plan.estimated_seconds is None:
+        estimate = 'unknown until a run with these settings completes'
+    else:
+        estimate = time_duration.seconds_to_units(plan.estimated_seconds)
+    return [
+        f'folders: {plan.folders}',
+        f'segments: {plan.segments}',
+        f'footage: {time_duration.seconds_to_units(plan.footage_seconds)}',
+        f'peak scratch space: {format_bytes(plan.peak_scratch_bytes)}',
+        f'output space: {format_bytes(plan.output_bytes)}',
+        f'estimated time: {estimate}',
+    ]
@@ -0,0 +1,82 @@
+' Encode throughput measured by earlier runs '
+import json
+import logging
+import os
+
+from . import(
+    constants,
+    encoder_pool
+)
+
+LOGGER = logging.getLogger(constants.LOGGER_NAME)
+
+def get_throughput_key(layout_options):
+    ' Runs only calibrate estimates for runs with the same encoding and compositing settings '
+    codec = '+'.join(
+        f'{codec_name}:{capacity}'
+        for codec_name, capacity in encoder_pool.get_codec_capacities(layout_options.codec).items()
+    )
+    video_layout = layout_options.layout
+    if not isinstance(video_layout, str):
+        video_layout = json.dumps(video_layout, sort_keys=True)
+    if layout_options.cameras:
+        video_layout += f'[{",".join(sorted(layout_options.cameras))}]'
+    preset = layout_options.preset
+    if isinstance(preset, dict):
+        preset = '+'.join(
+            f'{codec_name}:{codec_preset}' for codec_name, codec_preset in preset.items()
+        )
+    # Reduce is an int by default and a float from the command line, so format it one way
+    return (
+        f'{codec}|{preset}|{video_layout}|{float(layout_options.reduce)}|'
+        f'{layout_options.compositor}'
+    )
+
+
+def get_throughput_file_path(output_folder_path):
+    ' Throughput is stored next to the videos it was measured with '
+    return output_folder_path / constants.THROUGHPUT_FILE_NAME
+
+
+def load_throughputs(output_folder_path):
+    ' Load measured throughput for every key or nothing if there are no earlier runs '
+    try:
+        with open(get_throughput_file_path(output_folder_path)) as throughput_file:
+            return json.load(throughput_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as json_error:
+        LOGGER.warning('ignore measured throughput because it is unreadable: %s', json_error)
+        return {}
+
+
+def record_throughput(
+        output_folder_path,
+        layout_options,
+        footage_seconds,
+        elapsed_seconds,
+        scratch_bytes
+):
+    ' Add a finished run to the measured totals for its settings '
+    throughputs = load_throughputs(output_folder_path)
+    totals = throughputs.setdefault(
+        get_throughput_key(layout_options),
+        {'footage_seconds': 0, 'elapsed_seconds': 0, 'scratch_bytes': 0}
+    )
+    totals['footage_seconds'] += footage_seconds
+    totals['elapsed_seconds'] += elapsed_seconds
+    totals['scratch_bytes'] += scratch_bytes
+
+    # Replace the file in one step so an interrupted write never loses earlier runs
+    throughput_file_path = get_throughput_file_path(output_folder_path)
+    temporary_file_path = throughput_file_path.with_suffix('.tmp')
+    with open(temporary_file_path, 'w') as throughput_file:
+        json.dump(throughputs, throughput_file, indent=4)
+    os.replace(temporary_file_path, throughput_file_path)
+
+
+def get_folder_size(folder_path):
+    ' Total bytes of every file under a folder '
+    return sum(
+        file_path.stat().st_size for file_path in folder_path.rglob('*') if file_path.is_file()
+    )